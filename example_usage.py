@@ -10,12 +10,15 @@ import asyncio
 import logging
 import random
 import re
+import shutil
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional, Tuple
-from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Iterable, Iterator, List, Optional, TextIO, Tuple
+from dataclasses import dataclass, field, replace
 
 from scraper import scrape_school_by_code, scrape_schools_batch, SchoolScraper, print_school_data, SchoolData
 
@@ -30,21 +33,30 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Coordinates embedded in Google Maps place URLs
+_COORD_RE = re.compile(r'place/(-?\d+\.\d+),(-?\d+\.\d+)')
+
+# Write buffer for the result files; completed results are written and flushed together
+OUTPUT_BUFFER_SIZE = 1 << 16
+
 
 @dataclass
 class ScraperConfig:
     """Configuration for the scraper."""
     max_concurrent_requests: int = 3
-    batch_delay_min: float = 1.0
-    batch_delay_max: float = 2.0
+    # Worker processes, each with its own event loop and share of the rate
+    # limit; raise towards os.cpu_count() when parsing becomes the bottleneck
+    num_processes: int = 1
     retry_max_attempts: int = 3
     retry_base_delay: float = 1.0
     retry_max_delay: float = 60.0
-    request_jitter_min: float = 0.1
-    request_jitter_max: float = 0.5
+    requests_per_second: float = 3.0
+    request_burst: int = 6
+    input_file: str = "clave_ct_list_filtrados.txt"
     output_file: str = "ct_codes_coords_googlelinks_filtrados.txt"
     progress_file: str = "scraper_progress_filtrados.txt"
     failed_codes_file: str = "failed_ct_codes_filtrados.txt"
+    html_cache_dir: Optional[str] = "html_cache"
 
 
 @dataclass
@@ -57,12 +69,40 @@ class ScrapeResult:
     timestamp: datetime = field(default_factory=datetime.now)
 
 
+class TokenBucket:
+    """Token bucket limiting the aggregate request rate across all workers."""
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    async def acquire(self) -> None:
+        """Take a token, waiting only if the bucket is empty."""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
 class RateLimitedScraper:
-    """Wrapper for SchoolScraper with rate limiting and retry logic."""
+    """
+    Wrapper for SchoolScraper with rate limiting and retry logic.
+    
+    Concurrency is bounded by the number of workers calling
+    scrape_with_retry, see scrape_codes().
+    """
     
     def __init__(self, config: ScraperConfig):
         self.config = config
-        self.semaphore = asyncio.Semaphore(config.max_concurrent_requests)
+        self.bucket = TokenBucket(rate=config.requests_per_second, burst=config.request_burst)
         self.request_count = 0
         self.last_request_time = 0
         
@@ -74,27 +114,26 @@ class RateLimitedScraper:
             result.attempts = attempt
             
             try:
-                # Add random jitter before request
-                jitter = random.uniform(
-                    self.config.request_jitter_min,
-                    self.config.request_jitter_max
-                )
-                await asyncio.sleep(jitter)
+                # Wait for the shared rate limit before the request
+                await self.bucket.acquire()
                 
-                # Acquire semaphore for rate limiting
-                async with self.semaphore:
-                    logger.info(f"Attempt {attempt}/{self.config.retry_max_attempts} for {ct_code}")
-                    
-                    # Make the request
-                    school_data = await scraper.scrape_school_data(ct_code)
+                logger.info(f"Attempt {attempt}/{self.config.retry_max_attempts} for {ct_code}")
+                
+                # Make the request
+                school_data = await scraper.scrape_school_data(ct_code)
+                
+                if school_data.success:
+                    result.school_data = school_data
+                    logger.info(f"Successfully scraped {ct_code} on attempt {attempt}")
+                    return result
+                else:
+                    result.last_error = school_data.error_message
+                    logger.warning(f"Failed to scrape {ct_code}: {school_data.error_message}")
                     
-                    if school_data.success:
-                        result.school_data = school_data
-                        logger.info(f"Successfully scraped {ct_code} on attempt {attempt}")
+                    # Client errors such as 404 won't change on a retry
+                    if not school_data.is_retriable:
+                        logger.info(f"Not retrying {ct_code}: error is not retriable")
                         return result
-                    else:
-                        result.last_error = school_data.error_message
-                        logger.warning(f"Failed to scrape {ct_code}: {school_data.error_message}")
                         
             except asyncio.TimeoutError as e:
                 result.last_error = f"Timeout: {str(e)}"
@@ -120,44 +159,136 @@ class RateLimitedScraper:
 
 def load_progress(progress_file: str) -> set:
     """Load already processed CT codes from progress file."""
-    processed = set()
-    if Path(progress_file).exists():
+    try:
         with open(progress_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                if line.strip():
-                    # Extract ct_code from saved line
-                    ct_code = line.split('-')[0].strip()
-                    processed.add(ct_code)
+            # Extract ct_code from each saved line; blank lines yield an empty key
+            processed = {line.partition('-')[0].strip() for line in f}
+    except FileNotFoundError:
+        return set()
+    processed.discard('')
     return processed
 
 
-def save_result_incrementally(result: ScrapeResult, config: ScraperConfig) -> bool:
-    """Save successful result to file incrementally."""
+def count_codes(input_file: str, processed: set) -> Tuple[int, int]:
+    """Count all CT codes in the input file and those not yet processed."""
+    total = 0
+    remaining = 0
+    with open(input_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            code = line.strip()
+            if code:
+                total += 1
+                if code not in processed:
+                    remaining += 1
+    return total, remaining
+
+
+def iter_unprocessed(input_file: str, processed: set) -> Iterator[str]:
+    """Stream CT codes from the input file, skipping already processed ones."""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            code = line.strip()
+            if code and code not in processed:
+                yield code
+
+
+def iter_failed_codes(failed_file: str) -> Iterator[str]:
+    """Stream the CT codes recorded in the failed codes file."""
+    with open(failed_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            ct_code = line.partition('|')[0].strip()
+            if ct_code:
+                yield ct_code
+
+
+@contextmanager
+def open_output_files(config: ScraperConfig) -> Iterator[Tuple[TextIO, TextIO, TextIO]]:
+    """Open the output, progress and failed codes files once for buffered appending."""
+    with (
+        open(config.output_file, 'a', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE) as out_f,
+        open(config.progress_file, 'a', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE) as prog_f,
+        open(config.failed_codes_file, 'a', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE) as failed_f,
+    ):
+        yield out_f, prog_f, failed_f
+
+
+def format_result_line(result: ScrapeResult) -> Optional[str]:
+    """Format a successful result as an output/progress line, or None if unusable."""
     if result.school_data and result.school_data.success and result.school_data.href:
         # Extract coordinates from Google Maps URL
-        coord_match = re.search(r'place/(-?\d+\.\d+),(-?\d+\.\d+)', result.school_data.href)
+        coord_match = _COORD_RE.search(result.school_data.href)
         if coord_match:
             lat, lng = coord_match.groups()
             coords = f"{lat},{lng}"
-            line = f"{result.school_data.ct_code}-{coords}-{result.school_data.href}"
-            
-            # Append to output file
-            with open(config.output_file, 'a', encoding='utf-8') as f:
-                f.write(line + "\n")
-            
-            # Also save to progress file
-            with open(config.progress_file, 'a', encoding='utf-8') as f:
-                f.write(line + "\n")
-            
-            logger.info(f"Saved result for {result.ct_code}: {coords}")
-            return True
-    return False
+            logger.info(f"Got coordinates for {result.ct_code}: {coords}")
+            return f"{result.school_data.ct_code}-{coords}-{result.school_data.href}\n"
+    return None
+
+
+def format_failed_line(ct_code: str, error: str) -> str:
+    """Format a failed CT code as a failed codes line for later retry."""
+    return f"{ct_code}|{error}|{datetime.now().isoformat()}\n"
 
 
-def save_failed_code(ct_code: str, error: str, config: ScraperConfig):
-    """Save failed CT code for later retry."""
-    with open(config.failed_codes_file, 'a', encoding='utf-8') as f:
-        f.write(f"{ct_code}|{error}|{datetime.now().isoformat()}\n")
+async def scrape_codes(
+    scraper: SchoolScraper,
+    rate_limiter: "RateLimitedScraper",
+    ct_codes: Iterable[str],
+    num_workers: int
+) -> AsyncIterator[List[ScrapeResult]]:
+    """
+    Scrape CT codes with a fixed pool of workers.
+    
+    Every worker picks the next code as soon as it is done with the previous
+    one, so a slow code never holds up the others. Results are yielded in
+    groups of whatever has completed since the last group was consumed.
+    """
+    code_queue: asyncio.Queue[Optional[str]] = asyncio.Queue(maxsize=num_workers * 2)
+    result_queue: asyncio.Queue[Optional[ScrapeResult]] = asyncio.Queue()
+    
+    async def produce():
+        try:
+            for ct_code in ct_codes:
+                await code_queue.put(ct_code)
+        finally:
+            # One stop marker per worker
+            for _ in range(num_workers):
+                await code_queue.put(None)
+    
+    async def work():
+        try:
+            while (ct_code := await code_queue.get()) is not None:
+                try:
+                    result = await rate_limiter.scrape_with_retry(scraper, ct_code)
+                except Exception as e:
+                    logger.error(f"Exception processing {ct_code}: {e}")
+                    result = ScrapeResult(ct_code=ct_code, last_error=str(e))
+                await result_queue.put(result)
+        finally:
+            await result_queue.put(None)
+    
+    producer = asyncio.create_task(produce())
+    workers = [asyncio.create_task(work()) for _ in range(num_workers)]
+    try:
+        finished = 0
+        while finished < num_workers:
+            results = []
+            item = await result_queue.get()
+            while True:
+                if item is None:
+                    finished += 1
+                else:
+                    results.append(item)
+                if result_queue.empty():
+                    break
+                item = result_queue.get_nowait()
+            if results:
+                yield results
+        # Surface errors from reading the codes
+        await producer
+    finally:
+        for task in [producer, *workers]:
+            task.cancel()
 
 
 def print_progress_bar(current: int, total: int, success: int, failed: int, width: int = 50):
@@ -169,6 +300,141 @@ def print_progress_bar(current: int, total: int, success: int, failed: int, widt
     print(f"\r[{bar}] {percentage:.1f}% | {current}/{total} | ✅ {success} | ❌ {failed}", end='', flush=True)
 
 
+class ThrottledProgressBar:
+    """Progress bar that redraws at most once per interval."""
+    
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self._last_draw = float('-inf')
+    
+    def update(self, current: int, total: int, success: int, failed: int, force: bool = False):
+        """Redraw the bar if forced, complete, or the interval has elapsed."""
+        now = time.monotonic()
+        if force or current >= total or now - self._last_draw >= self.interval:
+            print_progress_bar(current, total, success, failed)
+            self._last_draw = now
+
+
+async def scrape_to_files(
+    ct_codes: Iterable[str],
+    config: ScraperConfig,
+    on_result: Optional[Callable[[ScrapeResult, bool], None]] = None
+) -> Tuple[int, int]:
+    """
+    Scrape CT codes and append the results to the files named in the config.
+    
+    Args:
+        ct_codes: The school codes to scrape
+        config: Scraper configuration
+        on_result: Called with every result and whether it was saved
+        
+    Returns:
+        Number of successful and failed codes
+    """
+    rate_limiter = RateLimitedScraper(config)
+    successful_count = 0
+    failed_count = 0
+    
+    with open_output_files(config) as (out_f, prog_f, failed_f):
+        async with SchoolScraper(
+            timeout=45000,
+            max_connections=config.max_concurrent_requests,
+            cache_dir=config.html_cache_dir
+        ) as scraper:
+            async for results in scrape_codes(
+                scraper, rate_limiter, ct_codes, config.max_concurrent_requests
+            ):
+                # Process results, collecting the lines to write for this group
+                success_lines: List[str] = []
+                failed_lines: List[str] = []
+                for result in results:
+                    line = format_result_line(result)
+                    if line:
+                        success_lines.append(line)
+                        successful_count += 1
+                    else:
+                        failed_count += 1
+                        failed_lines.append(
+                            format_failed_line(result.ct_code, result.last_error or "Unknown error")
+                        )
+                    
+                    if on_result:
+                        on_result(result, line is not None)
+                
+                # Write and flush the completed results in one go
+                out_f.writelines(success_lines)
+                prog_f.writelines(success_lines)
+                failed_f.writelines(failed_lines)
+                out_f.flush()
+                prog_f.flush()
+                failed_f.flush()
+    
+    return successful_count, failed_count
+
+
+def shard_config(config: ScraperConfig, index: int) -> ScraperConfig:
+    """Config for one shard: its own result files and its share of the rate limit."""
+    return replace(
+        config,
+        num_processes=1,
+        requests_per_second=config.requests_per_second / config.num_processes,
+        request_burst=max(1, config.request_burst // config.num_processes),
+        output_file=f"{config.output_file}.{index}",
+        progress_file=f"{config.progress_file}.{index}",
+        failed_codes_file=f"{config.failed_codes_file}.{index}"
+    )
+
+
+def scrape_shard(shard: List[str], index: int, config: ScraperConfig) -> Tuple[int, int]:
+    """Scrape one shard of CT codes in a worker process with its own event loop."""
+    return asyncio.run(scrape_to_files(shard, shard_config(config, index)))
+
+
+def merge_shard_files(config: ScraperConfig) -> None:
+    """Append the per-shard result files to the main ones and remove them."""
+    for index in range(config.num_processes):
+        shard = shard_config(config, index)
+        for shard_file, target_file in (
+            (shard.output_file, config.output_file),
+            (shard.progress_file, config.progress_file),
+            (shard.failed_codes_file, config.failed_codes_file)
+        ):
+            try:
+                src = open(shard_file, 'rb')
+            except FileNotFoundError:
+                continue
+            with src, open(target_file, 'ab') as dst:
+                shutil.copyfileobj(src, dst)
+            Path(shard_file).unlink()
+
+
+async def scrape_sharded(ct_codes: Iterable[str], config: ScraperConfig) -> Tuple[int, int]:
+    """
+    Spread CT codes over config.num_processes worker processes.
+    
+    Every process writes its own result files, which are merged into the
+    configured files once all processes have finished (or failed).
+    
+    Returns:
+        Number of successful and failed codes
+    """
+    codes = list(ct_codes)
+    shards = [codes[i::config.num_processes] for i in range(config.num_processes)]
+    loop = asyncio.get_running_loop()
+    
+    try:
+        with ProcessPoolExecutor(max_workers=config.num_processes) as executor:
+            counts = await asyncio.gather(*(
+                loop.run_in_executor(executor, scrape_shard, shard, index, config)
+                for index, shard in enumerate(shards)
+                if shard
+            ))
+    finally:
+        merge_shard_files(config)
+    
+    return sum(success for success, _ in counts), sum(failed for _, failed in counts)
+
+
 async def read_ct_codes_from_file():
     """Read ct_codes from file and create ct_code-coords-googlelink txt file with advanced scraping."""
     config = ScraperConfig()
@@ -177,93 +443,75 @@ async def read_ct_codes_from_file():
     print("\n=== Advanced CT Code Processing ===")
     print(f"Configuration:")
     print(f"  - Max concurrent requests: {config.max_concurrent_requests}")
+    print(f"  - Processes: {config.num_processes}")
+    print(f"  - Rate limit: {config.requests_per_second}/s (burst {config.request_burst})")
     print(f"  - Retry attempts: {config.retry_max_attempts}")
-    print(f"  - Batch delay: {config.batch_delay_min}-{config.batch_delay_max}s")
     print(f"  - Output file: {config.output_file}")
     print(f"  - Progress tracking: {config.progress_file}")
     print(f"  - Failed codes log: {config.failed_codes_file}\n")
     
     try:
-        # Read ct_codes from file
-        with open("clave_ct_list_filtrados.txt", "r", encoding="utf-8") as f:
-            all_ct_codes = [line.strip() for line in f if line.strip()]
+        # Load progress and count the codes still to process; the codes
+        # themselves are streamed from the file to the workers
+        processed_codes = load_progress(config.progress_file)
+        total_codes, remaining_codes = count_codes(config.input_file, processed_codes)
         
-        if not all_ct_codes:
+        if not total_codes:
             logger.warning("No ct_codes found in file.")
             print("No ct_codes found in file.")
             return
         
-        # Load progress and filter out already processed codes
-        processed_codes = load_progress(config.progress_file)
-        ct_codes = [code for code in all_ct_codes if code not in processed_codes]
-        
-        if not ct_codes:
-            print(f"All {len(all_ct_codes)} codes have already been processed.")
+        if not remaining_codes:
+            print(f"All {total_codes} codes have already been processed.")
             logger.info(f"All codes already processed. Check {config.output_file}")
             return
         
-        print(f"Found {len(all_ct_codes)} total codes, {len(processed_codes)} already processed")
-        print(f"Processing {len(ct_codes)} remaining codes...\n")
-        logger.info(f"Processing {len(ct_codes)} ct_codes (skipping {len(processed_codes)} already done)")
+        print(f"Found {total_codes} total codes, {len(processed_codes)} already processed")
+        print(f"Processing {remaining_codes} remaining codes...\n")
+        logger.info(f"Processing {remaining_codes} ct_codes (skipping {len(processed_codes)} already done)")
         
-        # Initialize rate limiter and counters
-        rate_limiter = RateLimitedScraper(config)
+        # Initialize counters
         successful_count = 0
         failed_count = 0
         total_processed = 0
+        progress_bar = ThrottledProgressBar()
         
-        # Process in batches
-        batch_size = config.max_concurrent_requests
-        total_batches = (len(ct_codes) + batch_size - 1) // batch_size
+        def report(result: ScrapeResult, saved: bool):
+            nonlocal successful_count, failed_count, total_processed
+            total_processed += 1
+            
+            if saved:
+                successful_count += 1
+                print(f"  ✅ {result.ct_code} - Saved successfully")
+            else:
+                failed_count += 1
+                print(f"  ❌ {result.ct_code} - Failed: {result.last_error}")
+            
+            # Update progress bar
+            progress_bar.update(
+                total_processed + len(processed_codes),
+                total_codes,
+                successful_count + len(processed_codes),
+                failed_count
+            )
         
-        async with SchoolScraper(headless=True, timeout=45000) as scraper:
-            for batch_num, i in enumerate(range(0, len(ct_codes), batch_size), 1):
-                batch = ct_codes[i:i + batch_size]
-                
-                logger.info(f"Processing batch {batch_num}/{total_batches} ({len(batch)} codes)")
-                print(f"\n📦 Batch {batch_num}/{total_batches} ({len(batch)} codes)")
-                
-                # Create tasks for concurrent processing
-                tasks = []
-                for ct_code in batch:
-                    task = rate_limiter.scrape_with_retry(scraper, ct_code)
-                    tasks.append(task)
-                
-                # Process batch concurrently
-                batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-                
-                # Process results
-                for result in batch_results:
-                    total_processed += 1
-                    
-                    if isinstance(result, Exception):
-                        failed_count += 1
-                        logger.error(f"Exception processing code: {result}")
-                        continue
-                    
-                    if isinstance(result, ScrapeResult):
-                        if save_result_incrementally(result, config):
-                            successful_count += 1
-                            print(f"  ✅ {result.ct_code} - Saved successfully")
-                        else:
-                            failed_count += 1
-                            save_failed_code(result.ct_code, result.last_error or "Unknown error", config)
-                            print(f"  ❌ {result.ct_code} - Failed: {result.last_error}")
-                    
-                    # Update progress bar
-                    print_progress_bar(
-                        total_processed + len(processed_codes),
-                        len(all_ct_codes),
-                        successful_count + len(processed_codes),
-                        failed_count
-                    )
-                
-                # Add delay between batches
-                if batch_num < total_batches:
-                    delay = random.uniform(config.batch_delay_min, config.batch_delay_max)
-                    logger.info(f"Waiting {delay:.2f}s before next batch...")
-                    print(f"\n⏳ Waiting {delay:.2f}s before next batch...")
-                    await asyncio.sleep(delay)
+        ct_codes = iter_unprocessed(config.input_file, processed_codes)
+        
+        if config.num_processes > 1:
+            print(f"Scraping in {config.num_processes} processes...")
+            successful_count, failed_count = await scrape_sharded(ct_codes, config)
+            total_processed = successful_count + failed_count
+        else:
+            await scrape_to_files(ct_codes, config, on_result=report)
+        
+        # Always draw the final state of the bar
+        progress_bar.update(
+            total_processed + len(processed_codes),
+            total_codes,
+            successful_count + len(processed_codes),
+            failed_count,
+            force=True
+        )
         
         # Final summary
         print("\n\n" + "=" * 60)
@@ -271,7 +519,7 @@ async def read_ct_codes_from_file():
         print("=" * 60)
         print(f"✅ Successfully processed: {successful_count} new codes")
         print(f"📝 Previously processed: {len(processed_codes)} codes")
-        print(f"✅ Total successful: {successful_count + len(processed_codes)}/{len(all_ct_codes)}")
+        print(f"✅ Total successful: {successful_count + len(processed_codes)}/{total_codes}")
         print(f"❌ Failed: {failed_count} codes")
         print(f"📁 Results saved to: {config.output_file}")
         print(f"📋 Failed codes logged to: {config.failed_codes_file}")
@@ -281,7 +529,7 @@ async def read_ct_codes_from_file():
         logger.info(f"Processing complete. Success: {successful_count}, Failed: {failed_count}")
         
     except FileNotFoundError:
-        error_msg = "File 'clave_ct_list_filtrados.txt' not found."
+        error_msg = f"File '{config.input_file}' not found."
         print(f"❌ {error_msg}")
         logger.error(error_msg)
     except Exception as e:
@@ -294,26 +542,17 @@ async def retry_failed_codes():
     """Retry processing of previously failed CT codes."""
     config = ScraperConfig()
     
-    if not Path(config.failed_codes_file).exists():
+    # Read failed codes, removing duplicates while keeping file order
+    try:
+        failed_codes = list(dict.fromkeys(iter_failed_codes(config.failed_codes_file)))
+    except FileNotFoundError:
         print(f"No failed codes file found: {config.failed_codes_file}")
         return
     
-    # Read failed codes
-    failed_codes = []
-    with open(config.failed_codes_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                parts = line.split('|')
-                if parts:
-                    failed_codes.append(parts[0].strip())
-    
     if not failed_codes:
         print("No failed codes to retry.")
         return
     
-    # Remove duplicates
-    failed_codes = list(set(failed_codes))
-    
     print(f"\n=== Retrying {len(failed_codes)} Failed Codes ===")
     logger.info(f"Retrying {len(failed_codes)} failed codes")
     
@@ -321,35 +560,19 @@ async def retry_failed_codes():
     Path(config.failed_codes_file).rename(f"{config.failed_codes_file}.bak")
     
     # Process failed codes with the same logic
-    rate_limiter = RateLimitedScraper(config)
     successful_count = 0
     still_failed_count = 0
     
-    async with SchoolScraper(headless=True, timeout=45000) as scraper:
-        for i in range(0, len(failed_codes), config.max_concurrent_requests):
-            batch = failed_codes[i:i + config.max_concurrent_requests]
-            
-            tasks = []
-            for ct_code in batch:
-                task = rate_limiter.scrape_with_retry(scraper, ct_code)
-                tasks.append(task)
-            
-            batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            for result in batch_results:
-                if isinstance(result, ScrapeResult):
-                    if save_result_incrementally(result, config):
-                        successful_count += 1
-                        print(f"  ✅ {result.ct_code} - Now successful!")
-                    else:
-                        still_failed_count += 1
-                        save_failed_code(result.ct_code, result.last_error or "Unknown error", config)
-                        print(f"  ❌ {result.ct_code} - Still failing")
-            
-            # Add delay between batches
-            if i + config.max_concurrent_requests < len(failed_codes):
-                delay = random.uniform(config.batch_delay_min, config.batch_delay_max)
-                await asyncio.sleep(delay)
+    def report(result: ScrapeResult, saved: bool):
+        nonlocal successful_count, still_failed_count
+        if saved:
+            successful_count += 1
+            print(f"  ✅ {result.ct_code} - Now successful!")
+        else:
+            still_failed_count += 1
+            print(f"  ❌ {result.ct_code} - Still failing")
+    
+    await scrape_to_files(failed_codes, config, on_result=report)
     
     print(f"\n📊 Retry Summary:")
     print(f"✅ Successfully recovered: {successful_count}/{len(failed_codes)}")
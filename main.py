@@ -1,19 +1,46 @@
 import csv
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from pathlib import Path
+
+def read_clave_ct_rows(csv_file_path):
+    # Row-by-row reader that tolerates ragged rows
+    with open(csv_file_path, 'r', encoding='utf-8', newline='') as file:
+        csv_reader = csv.reader(file)
+        
+        header = next(csv_reader, [])
+        if 'CLAVE CT' not in header:
+            return []
+        idx = header.index('CLAVE CT')
+        return [row[idx] if len(row) > idx else '' for row in csv_reader]
 
 def extract_clave_ct(csv_file_path, output_txt_path):
-    clave_ct_list = []
+    try:
+        # Parse only the CLAVE CT column, in Arrow's C++ CSV reader
+        table = pacsv.read_csv(
+            csv_file_path,
+            convert_options=pacsv.ConvertOptions(
+                include_columns=['CLAVE CT'],
+                include_missing_columns=True,
+                column_types={'CLAVE CT': pa.string()}
+            )
+        )
+        claves = table.column('CLAVE CT').to_pylist()
+    except pa.ArrowInvalid:
+        # Arrow rejects rows with a different column count (common in
+        # spreadsheet exports), so fall back to the csv module for those files
+        claves = read_clave_ct_rows(csv_file_path)
     
-    with open(csv_file_path, 'r', encoding='utf-8') as file:
-        csv_reader = csv.DictReader(file)
-        
-        for row in csv_reader:
-            clave_ct = row.get('CLAVE CT', '').strip()
-            if clave_ct:
-                clave_ct_list.append(clave_ct)
+    clave_ct_list = [
+        clave.strip()
+        for clave in claves
+        if clave and clave.strip()
+    ]
     
-    with open(output_txt_path, 'w', encoding='utf-8') as output_file:
-        for clave in clave_ct_list:
-            output_file.write(clave + '\n')
+    Path(output_txt_path).write_text(
+        '\n'.join(clave_ct_list) + '\n' if clave_ct_list else '',
+        encoding='utf-8'
+    )
     
     return clave_ct_list
 
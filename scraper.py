@@ -1,16 +1,21 @@
 #!/usr/bin/env python3
 """
-Web scraper for escuelasmex.com using Playwright.
+Web scraper for escuelasmex.com using aiohttp.
 
 This module provides functionality to scrape school data from escuelasmex.com
-using the Playwright library with async/await patterns for optimal performance.
+by fetching the server-rendered HTML with aiohttp and parsing it with selectolax,
+using async/await patterns for optimal performance.
 """
 
 import asyncio
+import gzip
 import logging
+from pathlib import Path
 from typing import Dict, Optional, Any, List
 from dataclasses import dataclass
-from playwright.async_api import async_playwright, Browser, Page, TimeoutError, Error
+
+import aiohttp
+from selectolax.lexbor import LexborHTMLParser
 
 # Configure logging
 logging.basicConfig(
@@ -19,6 +24,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# HTTP error statuses that may succeed when retried
+RETRIABLE_STATUSES = {408, 429}
+
+# CSS equivalent of the XPath /html/body/div/div[5]/div[1]/div/a
+SCHOOL_LINK_SELECTOR = "body > div > div:nth-of-type(5) > div:nth-of-type(1) > div > a"
+
 
 @dataclass
 class SchoolData:
@@ -29,92 +40,123 @@ class SchoolData:
     ct_code: Optional[str] = None
     success: bool = False
     error_message: Optional[str] = None
+    is_retriable: bool = True
 
 
 class SchoolScraper:
     """
-    A robust web scraper for escuelasmex.com using Playwright.
+    A robust web scraper for escuelasmex.com using aiohttp.
     
-    This class handles browser management, error handling, and data extraction
-    with proper async/await patterns.
+    This class handles HTTP session management, error handling, and data
+    extraction with proper async/await patterns.
     """
     
     def __init__(
         self,
-        headless: bool = True,
         timeout: int = 30000,
-        user_agent: Optional[str] = None
+        user_agent: Optional[str] = None,
+        max_connections: int = 100,
+        cache_dir: Optional[str] = None
     ):
         """
         Initialize the scraper with configuration options.
         
         Args:
-            headless: Whether to run browser in headless mode
-            timeout: Timeout for page operations in milliseconds
+            timeout: Timeout for requests in milliseconds
             user_agent: Custom user agent string
+            max_connections: Size of the pool of reusable connections
+            cache_dir: Directory for gzipped copies of fetched pages, so that
+                re-runs parse them instead of fetching them again
         """
-        self.headless = headless
         self.timeout = timeout
         self.user_agent = user_agent or (
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
             "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
         )
-        self.browser: Optional[Browser] = None
+        self.max_connections = max_connections
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.connections_created = 0
+        self.connections_reused = 0
     
     async def __aenter__(self):
         """Async context manager entry."""
-        await self._initialize_browser()
+        # Track how often keep-alive connections are reused
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._on_connection_created)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+        
+        # One session is shared by every request; pages are stateless, so
+        # cookie bookkeeping is skipped entirely.
+        self.session = aiohttp.ClientSession(
+            headers={"User-Agent": self.user_agent, "Accept": "text/html"},
+            cookie_jar=aiohttp.DummyCookieJar(),
+            timeout=aiohttp.ClientTimeout(total=self.timeout / 1000),
+            connector=aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections,
+                keepalive_timeout=60,
+                ttl_dns_cache=300
+            ),
+            trace_configs=[trace_config]
+        )
+        logger.info("HTTP session initialized successfully")
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Async context manager exit with proper cleanup."""
         await self._cleanup()
     
-    async def _initialize_browser(self) -> None:
-        """Initialize the Playwright browser with proper configuration."""
-        try:
-            self.playwright = await async_playwright().start()
-            self.browser = await self.playwright.chromium.launch(
-                headless=self.headless,
-                args=[
-                    '--no-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-blink-features=AutomationControlled'
-                ]
-            )
-            logger.info("Browser initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize browser: {e}")
-            raise
+    async def _on_connection_created(self, session, trace_config_ctx, params) -> None:
+        self.connections_created += 1
+    
+    async def _on_connection_reused(self, session, trace_config_ctx, params) -> None:
+        self.connections_reused += 1
     
     async def _cleanup(self) -> None:
-        """Clean up browser resources."""
+        """Clean up HTTP session resources."""
         try:
-            if self.browser:
-                await self.browser.close()
-                logger.info("Browser closed successfully")
-            if hasattr(self, 'playwright'):
-                await self.playwright.stop()
+            if self.session:
+                await self.session.close()
+                logger.info(
+                    f"HTTP session closed successfully "
+                    f"(connections opened: {self.connections_created}, "
+                    f"reused: {self.connections_reused})"
+                )
         except Exception as e:
             logger.error(f"Error during cleanup: {e}")
     
-    async def _create_page(self) -> Page:
-        """Create a new page with proper configuration."""
-        if not self.browser:
-            raise RuntimeError("Browser not initialized. Use async context manager.")
-        
-        # Create browser context with user agent
-        context = await self.browser.new_context(
-            user_agent=self.user_agent,
-            viewport={"width": 1280, "height": 720}
-        )
-        
-        page = await context.new_page()
-        
-        # Set default timeout
-        page.set_default_timeout(self.timeout)
-        
-        return page
+    def _read_cached_html(self, ct_code: str) -> Optional[str]:
+        """Return the cached page for a ct_code, if any."""
+        if not self.cache_dir:
+            return None
+        try:
+            return gzip.decompress((self.cache_dir / f"{ct_code}.html.gz").read_bytes()).decode("utf-8")
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, UnicodeDecodeError) as e:
+            logger.warning(f"Ignoring unreadable cache entry for ct_code {ct_code}: {e}")
+            return None
+    
+    def _write_cached_html(self, ct_code: str, html: str) -> None:
+        """Store a fetched page in the cache."""
+        if not self.cache_dir:
+            return
+        try:
+            (self.cache_dir / f"{ct_code}.html.gz").write_bytes(gzip.compress(html.encode("utf-8")))
+        except OSError as e:
+            logger.warning(f"Could not cache page for ct_code {ct_code}: {e}")
+    
+    def _discard_cached_html(self, ct_code: str) -> None:
+        """Remove a cached page that turned out to be unusable."""
+        if not self.cache_dir:
+            return
+        try:
+            (self.cache_dir / f"{ct_code}.html.gz").unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Could not remove cached page for ct_code {ct_code}: {e}")
     
     async def scrape_school_data(self, ct_code: str) -> SchoolData:
         """
@@ -126,70 +168,74 @@ class SchoolScraper:
         Returns:
             SchoolData object containing scraped information
         """
+        if not self.session:
+            raise RuntimeError("HTTP session not initialized. Use async context manager.")
+        
         url = f"https://escuelasmex.com/directorio/{ct_code}"
-        xpath = "/html/body/div/div[5]/div[1]/div/a"
         
         logger.info(f"Scraping data for ct_code: {ct_code}")
         
-        page = None
         try:
-            page = await self._create_page()
-            
-            # Navigate to the URL with a more flexible wait strategy
-            logger.info(f"Navigating to: {url}")
-            response = await page.goto(url, wait_until="domcontentloaded")
-            
-            if not response:
-                error_msg = "Failed to get response from page"
-                logger.error(error_msg)
-                return SchoolData(
-                    ct_code=ct_code,
-                    success=False,
-                    error_message=error_msg
-                )
+            html = self._read_cached_html(ct_code)
+            from_cache = html is not None
+            if from_cache:
+                logger.info(f"Using cached page for ct_code: {ct_code}")
+            else:
+                logger.info(f"Fetching: {url}")
+                async with self.session.get(url) as response:
+                    # Check if we got redirected or if the status is acceptable
+                    final_url = str(response.url)
+                    if response.status >= 400:
+                        error_msg = f"HTTP error: {response.status} for URL: {final_url}"
+                        logger.error(error_msg)
+                        return SchoolData(
+                            ct_code=ct_code,
+                            success=False,
+                            error_message=error_msg,
+                            is_retriable=(
+                                response.status >= 500
+                                or response.status in RETRIABLE_STATUSES
+                            )
+                        )
+                    
+                    # Only the HTML document is needed; don't download anything else
+                    if response.content_type != "text/html":
+                        error_msg = f"Unexpected content type: {response.content_type} for URL: {final_url}"
+                        logger.error(error_msg)
+                        return SchoolData(
+                            ct_code=ct_code,
+                            success=False,
+                            error_message=error_msg
+                        )
+                    
+                    html = await response.text()
                 
-            # Check if we got redirected or if the status is acceptable
-            final_url = page.url
-            if response.status >= 400:
-                error_msg = f"HTTP error: {response.status} for URL: {final_url}"
-                logger.error(error_msg)
-                return SchoolData(
-                    ct_code=ct_code,
-                    success=False,
-                    error_message=error_msg
-                )
-            
-            logger.info(f"Page loaded successfully. Final URL: {final_url}")
+                logger.info(f"Page loaded successfully. Final URL: {final_url}")
             
-            # Wait for the element to be present using XPath locator
-            element = page.locator(f"xpath={xpath}")
+            # The target link is part of the server-rendered HTML
+            element = LexborHTMLParser(html).css_first(SCHOOL_LINK_SELECTOR)
             
-            try:
-                await element.wait_for(state="visible", timeout=10000)
-            except TimeoutError:
+            if element is None:
                 logger.warning(f"Target element not found for ct_code: {ct_code}")
+                # Don't keep serving an error or rate-limit page from the cache
+                if from_cache:
+                    self._discard_cached_html(ct_code)
                 return SchoolData(
                     ct_code=ct_code,
                     success=False,
                     error_message="Target element not found"
                 )
             
-            # Check if element exists
-            if await element.count() == 0:
-                logger.warning(f"Element not found at xpath: {xpath}")
-                return SchoolData(
-                    ct_code=ct_code,
-                    success=False,
-                    error_message="Element not found at specified xpath"
-                )
-            
             # Extract data from the element
-            text = await element.text_content()
-            href = await element.get_attribute("href")
-            title = await element.get_attribute("title")
-            print(text, href, title)
+            text = element.text()
+            href = element.attributes.get("href")
+            title = element.attributes.get("title")
             logger.info(f"Successfully scraped data for ct_code: {ct_code}")
             
+            # Only pages that yielded the link are worth caching
+            if href and not from_cache:
+                self._write_cached_html(ct_code, html)
+            
             return SchoolData(
                 text=text.strip() if text else None,
                 href=href,
@@ -198,7 +244,7 @@ class SchoolScraper:
                 success=True
             )
             
-        except TimeoutError as e:
+        except asyncio.TimeoutError as e:
             error_msg = f"Timeout error for ct_code {ct_code}: {e}"
             logger.error(error_msg)
             return SchoolData(
@@ -206,8 +252,8 @@ class SchoolScraper:
                 success=False,
                 error_message=error_msg
             )
-        except Error as e:
-            error_msg = f"Playwright error for ct_code {ct_code}: {e}"
+        except aiohttp.ClientError as e:
+            error_msg = f"HTTP client error for ct_code {ct_code}: {e}"
             logger.error(error_msg)
             return SchoolData(
                 ct_code=ct_code,
@@ -222,12 +268,6 @@ class SchoolScraper:
                 success=False,
                 error_message=error_msg
             )
-        finally:
-            if page:
-                # Close the page and its context
-                context = page.context
-                await page.close()
-                await context.close()
     
     async def scrape_multiple_schools(self, ct_codes: List[str]) -> List[SchoolData]:
         """
@@ -257,7 +297,6 @@ class SchoolScraper:
 
 async def scrape_school_by_code(
     ct_code: str,
-    headless: bool = True,
     timeout: int = 30000
 ) -> SchoolData:
     """
@@ -265,19 +304,17 @@ async def scrape_school_by_code(
     
     Args:
         ct_code: The school code to search for
-        headless: Whether to run browser in headless mode
-        timeout: Timeout for operations in milliseconds
+        timeout: Timeout for requests in milliseconds
         
     Returns:
         SchoolData object containing scraped information
     """
-    async with SchoolScraper(headless=headless, timeout=timeout) as scraper:
+    async with SchoolScraper(timeout=timeout) as scraper:
         return await scraper.scrape_school_data(ct_code)
 
 
 async def scrape_schools_batch(
     ct_codes: List[str],
-    headless: bool = True,
     timeout: int = 30000
 ) -> List[SchoolData]:
     """
@@ -285,13 +322,12 @@ async def scrape_schools_batch(
     
     Args:
         ct_codes: List of school codes to search for
-        headless: Whether to run browser in headless mode
-        timeout: Timeout for operations in milliseconds
+        timeout: Timeout for requests in milliseconds
         
     Returns:
         List of SchoolData objects
     """
-    async with SchoolScraper(headless=headless, timeout=timeout) as scraper:
+    async with SchoolScraper(timeout=timeout) as scraper:
         return await scraper.scrape_multiple_schools(ct_codes)
 
 
@@ -334,7 +370,7 @@ async def main():
     
     # # Example 3: Using the scraper class directly
     # print("\n3. Using scraper class directly:")
-    # async with SchoolScraper(headless=True) as scraper:
+    # async with SchoolScraper() as scraper:
     #     result = await scraper.scrape_school_data("21DPR0653I")
     #     print_school_data(result)
 
@@ -6,10 +6,11 @@ This module provides helper functions for monitoring progress,
 managing failed codes, and resetting the scraper state.
 """
 
+import os
 import sys
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Tuple
 
 
 def check_progress(progress_file: str = "scraper_progress.txt") -> Dict[str, int]:
@@ -20,19 +21,19 @@ def check_progress(progress_file: str = "scraper_progress.txt") -> Dict[str, int
         "coordinates_found": 0
     }
     
-    if not Path(progress_file).exists():
-        print(f"Progress file not found: {progress_file}")
-        return stats
-    
-    with open(progress_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                parts = line.split('-')
-                if len(parts) >= 2:
-                    ct_code = parts[0].strip()
-                    stats["unique_codes"].add(ct_code)
+    # Codes are only counted, so keep them as raw bytes instead of decoding
+    # every line
+    try:
+        with open(progress_file, 'rb') as f:
+            for line in f:
+                dash = line.find(b'-')
+                if dash != -1:
+                    stats["unique_codes"].add(line[:dash].strip())
                     stats["total_processed"] += 1
                     stats["coordinates_found"] += 1
+    except FileNotFoundError:
+        print(f"Progress file not found: {progress_file}")
+        return stats
     
     stats["unique_codes"] = len(stats["unique_codes"])
     return stats
@@ -42,19 +43,24 @@ def check_failed_codes(failed_file: str = "failed_ct_codes.txt") -> List[Tuple[s
     """Check failed codes and their error messages."""
     failed = []
     
-    if not Path(failed_file).exists():
+    # Lines are CT_CODE|ERROR|TIMESTAMP; only the three fields get decoded
+    try:
+        with open(failed_file, 'rb') as f:
+            for line in f:
+                first = line.find(b'|')
+                if first == -1:
+                    continue
+                second = line.find(b'|', first + 1)
+                if second == -1:
+                    continue
+                third = line.find(b'|', second + 1)
+                ct_code = line[:first].strip().decode('utf-8')
+                error = line[first + 1:second].strip().decode('utf-8')
+                timestamp = line[second + 1:third if third != -1 else None].strip().decode('utf-8')
+                failed.append((ct_code, error, timestamp))
+    except FileNotFoundError:
         return failed
     
-    with open(failed_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                parts = line.split('|')
-                if len(parts) >= 3:
-                    ct_code = parts[0].strip()
-                    error = parts[1].strip()
-                    timestamp = parts[2].strip()
-                    failed.append((ct_code, error, timestamp))
-    
     return failed
 
 
@@ -75,9 +81,18 @@ def reset_progress(
         (log_file, "log")
     ]
     
+    # List each containing directory once instead of stat-ing every file
+    existing = set()
+    for parent in {Path(file_path).parent for file_path, _ in files_to_reset}:
+        try:
+            with os.scandir(parent) as entries:
+                existing.update(parent / entry.name for entry in entries)
+        except FileNotFoundError:
+            continue
+    
     for file_path, file_type in files_to_reset:
         path = Path(file_path)
-        if path.exists():
+        if path in existing:
             if backup:
                 backup_name = f"{path.stem}_{timestamp}{path.suffix}"
                 backup_path = path.parent / backup_name
@@ -92,6 +107,15 @@ def reset_progress(
     print("\n✨ Progress reset complete!")
 
 
+def _iter_result_pairs(file_path: str) -> Iterator[Tuple[str, str]]:
+    """Yield (ct_code, rest) pairs from a results file."""
+    with open(file_path, 'rb') as f:
+        for line in f:
+            dash = line.find(b'-')
+            if dash != -1:
+                yield line[:dash].strip().decode('utf-8'), line[dash + 1:].strip().decode('utf-8')
+
+
 def merge_results(
     *result_files: str,
     output_file: str = "merged_results.txt"
@@ -99,67 +123,55 @@ def merge_results(
     """Merge multiple result files, removing duplicates."""
     all_results = {}
     
+    # Later lines overwrite earlier ones for the same code
     for file_path in result_files:
-        if Path(file_path).exists():
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if line.strip():
-                        parts = line.split('-', 1)
-                        if len(parts) >= 2:
-                            ct_code = parts[0].strip()
-                            rest = parts[1].strip()
-                            all_results[ct_code] = rest
-    
-    # Write merged results
+        try:
+            all_results.update(_iter_result_pairs(file_path))
+        except FileNotFoundError:
+            continue
+    
+    # Write merged results, sorting only the (unique) codes
     with open(output_file, 'w', encoding='utf-8') as f:
-        for ct_code, rest in sorted(all_results.items()):
-            f.write(f"{ct_code}-{rest}\n")
+        f.writelines(f"{ct_code}-{all_results[ct_code]}\n" for ct_code in sorted(all_results))
     
     print(f"✅ Merged {len(all_results)} unique results to: {output_file}")
     return len(all_results)
 
 
+# Results line format: CT_CODE-LATITUDE,LONGITUDE with an optional -GOOGLE_MAPS_URL
+RESULT_LINE_PATTERN = r'^(?P<ct_code>[^-]+)-(?P<latitude>-?\d+\.?\d*),(?P<longitude>-?\d+\.?\d*)(?:-(?P<google_maps_url>.+))?$'
+
+
 def extract_coordinates_to_csv(
     input_file: str = "ct_codes_coords_googlelinks.txt",
     output_file: str = "coordinates.csv"
 ):
     """Extract coordinates to CSV format."""
-    import csv
+    import pandas as pd
     
-    if not Path(input_file).exists():
+    try:
+        with open(input_file, 'r', encoding='utf-8') as f:
+            lines = pd.Series(f.read().splitlines(), dtype=str)
+    except FileNotFoundError:
         print(f"Input file not found: {input_file}")
         return
     
-    results = []
-    with open(input_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                parts = line.split('-')
-                if len(parts) >= 3:
-                    ct_code = parts[0].strip()
-                    coords = parts[1].strip()
-                    google_link = '-'.join(parts[2:]).strip()
-                    
-                    if ',' in coords:
-                        lat, lng = coords.split(',')
-                        results.append({
-                            'ct_code': ct_code,
-                            'latitude': lat,
-                            'longitude': lng,
-                            'google_maps_url': google_link
-                        })
-    
-    # Write to CSV
-    if results:
-        with open(output_file, 'w', newline='', encoding='utf-8') as f:
-            fieldnames = ['ct_code', 'latitude', 'longitude', 'google_maps_url']
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(results)
-        
-        print(f"✅ Exported {len(results)} coordinates to: {output_file}")
-    else:
+    # Parse every line at once. Longitudes are negative, so the lines can't
+    # simply be split on '-'.
+    df = lines.str.strip().str.extract(RESULT_LINE_PATTERN)
+    df = df.dropna(subset=['ct_code', 'latitude', 'longitude'])
+    
+    if df.empty:
         print("No coordinates found to export.")
+        return
+    
+    # Results written without a link get one built from the coordinates
+    df['google_maps_url'] = df['google_maps_url'].fillna(
+        "https://www.google.com/maps/place/" + df['latitude'] + "," + df['longitude']
+    )
+    df.to_csv(output_file, index=False)
+    
+    print(f"✅ Exported {len(df)} coordinates to: {output_file}")
 
 
 def main():
@@ -1,7 +1,15 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import folium
+from charset_normalizer import from_bytes
+from folium.plugins import FastMarkerCluster
 from streamlit_folium import st_folium
+import io
+import json
+import os
 import re
 from typing import Dict, List, Tuple, Optional
 
@@ -12,30 +20,90 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+COORDINATES_FILE = 'ct_codes_coords_googlelinks_filtrados.txt'
+METADATA_FILE = 'filtrados.csv'
+# Merged data from the two files above, reused while their mtimes match
+MERGED_CACHE_FILE = 'merged_cache.parquet'
+
+# Metadata columns offered as sidebar dropdown filters
+FILTER_COLUMNS = ['CORDE', 'NIVEL', 'FUNCIÓN Y CATALOGO', 'TIPO ASPIRANTE', 'MUNICIPIO CT']
+
+# Text columns searched or merged on, stored as Arrow-backed strings
+ARROW_STRING_COLUMNS = ['school_code', 'NOMBRE CT', 'LOCALIDAD CT']
+
+# Bounds for the caches keyed on filter state; the free-text code search
+# would otherwise keep one entry per distinct string typed, for good
+FILTER_CACHE_MAX_ENTRIES = 32
+FILTER_CACHE_TTL = 3600  # seconds
+
+# Coordinates line format: SCHOOL_CODE-LATITUDE,LONGITUDE
+COORD_LINE_PATTERN = re.compile(
+    r'^(?P<school_code>[^-]+)-(?P<latitude>-?\d+\.?\d*),(?P<longitude>-?\d+\.?\d*)'
+)
+
+# Optional metadata columns shown in marker popups, with their labels
+POPUP_FIELDS = [
+    ('NOMBRE CT', 'Name'),
+    ('LOCALIDAD CT', 'Location'),
+    ('MUNICIPIO CT', 'Municipality'),
+    ('CORDE', 'Region'),
+    ('NIVEL', 'Level'),
+    ('FUNCIÓN Y CATALOGO', 'Function'),
+    ('TIPO ASPIRANTE', 'Position Type'),
+]
+
+# Marker popup pieces, joined once per school
+POPUP_HEAD_TEMPLATE = '<b>School Code:</b> {code}<br><b>Coordinates:</b> {lat:.6f}, {lon:.6f}'
+POPUP_FIELD_TEMPLATE = '<br><b>{label}:</b> {value}'
+POPUP_MAPS_BUTTON_TEMPLATE = (
+    '<br><br><a href="https://www.google.com/maps/place/{lat},{lon}" target="_blank" style="'
+    'background-color: #4285f4; color: white; padding: 8px 12px; text-decoration: none; '
+    'border-radius: 4px; font-size: 12px; display: inline-block;">📍 Open in Google Maps</a>'
+)
+
+# Builds clustered markers in the browser from rows of
+# [lat, lon, school_code, *POPUP_FIELDS values]; popups are only rendered
+# when opened
+CLUSTER_MARKER_CALLBACK = """
+(function () {
+    var fieldLabels = __FIELD_LABELS__;
+    var icon = L.AwesomeMarkers.icon(
+        {"icon": "graduation-cap", "prefix": "fa", "markerColor": "blue"}
+    );
+    return function (row) {
+        var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+        marker.bindTooltip("School: " + row[2]);
+        marker.bindPopup(function () {
+            var html = "<b>School Code:</b> " + row[2] + "<br>" +
+                "<b>Coordinates:</b> " + row[0].toFixed(6) + ", " + row[1].toFixed(6);
+            for (var i = 0; i < fieldLabels.length; i++) {
+                if (row[i + 3] !== null) {
+                    html += "<br><b>" + fieldLabels[i] + ":</b> " + row[i + 3];
+                }
+            }
+            var url = "https://www.google.com/maps/place/" + row[0] + "," + row[1];
+            html += '<br><br><a href="' + url + '" target="_blank" style="' +
+                'background-color: #4285f4; color: white; padding: 8px 12px; ' +
+                'text-decoration: none; border-radius: 4px; font-size: 12px; ' +
+                'display: inline-block;">📍 Open in Google Maps</a>';
+            return html;
+        }, {maxWidth: 300});
+        return marker;
+    };
+})()
+"""
+
 @st.cache_data
 def load_coordinates_data() -> pd.DataFrame:
     """Load and parse the coordinates data from the text file."""
     try:
-        with open('ct_codes_coords_googlelinks_filtrados.txt', 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        data = []
-        for line in lines:
-            line = line.strip()
-            if line:
-                # Parse format: SCHOOL_CODE-LATITUDE,LONGITUDE
-                match = re.match(r'([^-]+)-(-?\d+\.?\d*),(-?\d+\.?\d*)', line)
-                if match:
-                    school_code = match.group(1)
-                    latitude = float(match.group(2))
-                    longitude = float(match.group(3))
-                    data.append({
-                        'school_code': school_code,
-                        'latitude': latitude,
-                        'longitude': longitude
-                    })
+        with open(COORDINATES_FILE, 'r', encoding='utf-8') as f:
+            lines = pd.Series(f.read().splitlines(), dtype=str)
         
-        df = pd.DataFrame(data)
+        # Parse format: SCHOOL_CODE-LATITUDE,LONGITUDE for all lines at once.
+        # Longitudes are negative, so the lines can't simply be split on '-'.
+        df = lines.str.strip().str.extract(COORD_LINE_PATTERN)
+        df = df.dropna().astype({'school_code': 'string[pyarrow]', 'latitude': 'float64', 'longitude': 'float64'})
         
         # Remove duplicates, keeping first occurrence
         df = df.drop_duplicates(subset=['school_code'], keep='first')
@@ -50,10 +118,24 @@ def load_coordinates_data() -> pd.DataFrame:
 def load_school_metadata() -> pd.DataFrame:
     """Load school metadata from CSV file."""
     try:
-        # Try different encodings
-        for encoding in ['utf-8', 'latin1', 'cp1252']:
+        # Detect the encoding from the start of the file, among the ones
+        # the data comes in, so the CSV is parsed only once
+        with open(METADATA_FILE, 'rb') as f:
+            sample = f.read(65536)
+        
+        # Cut a truncated sample back to a whole line, so it doesn't end
+        # in the middle of a multi-byte character
+        if len(sample) == 65536 and b'\n' in sample:
+            sample = sample[:sample.rindex(b'\n') + 1]
+        match = from_bytes(sample, cp_isolation=['utf_8', 'latin_1', 'cp1252']).best()
+        
+        # Non-ASCII bytes past the sample can still break the detected
+        # encoding, so keep the single-byte encodings as a fallback; with
+        # no detection, try them in the original utf-8 first order
+        encodings = ([match.encoding] if match is not None else ['utf-8']) + ['latin1', 'cp1252']
+        for encoding in encodings:
             try:
-                df = pd.read_csv('filtrados.csv', encoding=encoding)
+                df = pd.read_csv(METADATA_FILE, encoding=encoding, engine='c')
                 break
             except UnicodeDecodeError:
                 continue
@@ -68,37 +150,134 @@ def load_school_metadata() -> pd.DataFrame:
         if 'CLAVE CT' in df.columns:
             df = df.rename(columns={'CLAVE CT': 'school_code'})
         
+        # Arrow-backed strings for the searched and merged text columns
+        string_columns = [col for col in ARROW_STRING_COLUMNS if col in df.columns]
+        df = df.astype({col: 'string[pyarrow]' for col in string_columns})
+        
         return df
     
     except Exception as e:
         st.error(f"Error loading school metadata: {e}")
         return pd.DataFrame()
 
+def source_mtimes() -> List[Optional[int]]:
+    """Modification times of the source data files, None for missing ones."""
+    mtimes = []
+    for path in (COORDINATES_FILE, METADATA_FILE):
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            mtimes.append(None)
+    return mtimes
+
+def load_merged_cache(mtimes: List[Optional[int]]) -> Optional[pd.DataFrame]:
+    """Load the parquet cache if it was built from the current source files."""
+    try:
+        df = pd.read_parquet(MERGED_CACHE_FILE, engine='pyarrow')
+    except Exception:
+        return None
+    if df.attrs.get('source_mtimes') != mtimes:
+        return None
+    
+    # Parquet doesn't keep the string storage, so restore pyarrow strings
+    string_columns = [col for col in ARROW_STRING_COLUMNS if col in df.columns]
+    return df.astype({col: 'string[pyarrow]' for col in string_columns})
+
+def save_merged_cache(df: pd.DataFrame, mtimes: List[Optional[int]]):
+    """Write the merged data to the parquet cache, tagged with the source mtimes."""
+    df = df.copy()
+    df.attrs['source_mtimes'] = mtimes
+    try:
+        df.to_parquet(MERGED_CACHE_FILE, engine='pyarrow', compression='zstd')
+    except Exception as e:
+        st.warning(f"Could not write data cache: {e}")
+
 @st.cache_data
 def merge_school_data() -> pd.DataFrame:
     """Merge coordinates and metadata."""
+    mtimes = source_mtimes()
+    cached_df = load_merged_cache(mtimes)
+    if cached_df is not None:
+        return cached_df
+    
     coords_df = load_coordinates_data()
     metadata_df = load_school_metadata()
     
     if coords_df.empty:
         return pd.DataFrame()
     
+    # Validate coordinates (Mexico bounds approximately) before merging, so
+    # the merge only sees usable rows. The mask is built in place on the raw
+    # arrays instead of combining four temporary boolean Series.
+    lat = coords_df['latitude'].to_numpy()
+    lon = coords_df['longitude'].to_numpy()
+    in_bounds = lat >= 14
+    in_bounds &= lat <= 33
+    in_bounds &= lon >= -118
+    in_bounds &= lon <= -86
+    coords_df = coords_df[in_bounds]
+    
     if not metadata_df.empty and 'school_code' in metadata_df.columns:
         # Merge on school code
         merged_df = coords_df.merge(metadata_df, on='school_code', how='left')
+        # Only a complete merge is worth persisting; a failed metadata load
+        # must not be served from the cache until the sources change
+        save_merged_cache(merged_df, mtimes)
     else:
         merged_df = coords_df
     
-    # Validate coordinates (Mexico bounds approximately)
-    merged_df = merged_df[
-        (merged_df['latitude'] >= 14) & (merged_df['latitude'] <= 33) &
-        (merged_df['longitude'] >= -118) & (merged_df['longitude'] <= -86)
-    ]
-    
     return merged_df
 
-def create_map(df: pd.DataFrame, selected_schools: List[str] = None) -> folium.Map:
-    """Create a folium map with school markers."""
+@st.cache_resource
+def load_filter_index() -> Dict[str, Tuple[List, Dict[object, np.ndarray]]]:
+    """Sorted options and per-value row masks for each dropdown filter column."""
+    df = merge_school_data()
+    filter_index = {}
+    
+    for col in FILTER_COLUMNS:
+        if col in df.columns:
+            # Missing values get code -1 and are left out of the options
+            codes, values = pd.factorize(df[col], sort=True)
+            filter_index[col] = (values.tolist(), {value: codes == i for i, value in enumerate(values.tolist())})
+    
+    return filter_index
+
+@st.cache_data(max_entries=FILTER_CACHE_MAX_ENTRIES, ttl=FILTER_CACHE_TTL)
+def filter_school_data(search_code: str, region: str, level: str, function: str, tipo: str, municipio: str) -> pd.DataFrame:
+    """Return the schools matching the sidebar filters."""
+    df = merge_school_data()
+    filter_index = load_filter_index()
+    
+    # Fold every filter into one mask so the frame is indexed only once
+    mask = np.ones(len(df), dtype=bool)
+    
+    if search_code:
+        mask &= df['school_code'].str.contains(search_code, case=False, na=False, regex=False).to_numpy(dtype=bool)
+    
+    for col, value in zip(FILTER_COLUMNS, (region, level, function, tipo, municipio)):
+        if value != 'All' and col in filter_index:
+            mask &= filter_index[col][1][value]
+    
+    return df[mask]
+
+@st.cache_resource(max_entries=FILTER_CACHE_MAX_ENTRIES, ttl=FILTER_CACHE_TTL)
+def get_school_map(search_code: str, region: str, level: str, function: str, tipo: str, municipio: str, cluster: bool) -> folium.Map:
+    """Build the school map for a filter state, reusing it until the filters change."""
+    return create_map(filter_school_data(search_code, region, level, function, tipo, municipio), cluster=cluster)
+
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """Serialize a DataFrame to CSV with Arrow's writer."""
+    buf = io.BytesIO()
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), buf)
+    return buf.getvalue()
+
+@st.cache_data(max_entries=FILTER_CACHE_MAX_ENTRIES, ttl=FILTER_CACHE_TTL)
+def get_filtered_csv(search_code: str, region: str, level: str, function: str, tipo: str, municipio: str) -> bytes:
+    """CSV download for a filter state, reused until the filters change."""
+    return to_csv_bytes(filter_school_data(search_code, region, level, function, tipo, municipio))
+
+def create_map(df: pd.DataFrame, selected_schools: List[str] = None, cluster: bool = True) -> folium.Map:
+    """Create a folium map with school markers, clustered in the browser unless disabled."""
     if df.empty:
         # Default map centered on Mexico with better tile layer
         m = folium.Map(
@@ -150,52 +329,48 @@ def create_map(df: pd.DataFrame, selected_schools: List[str] = None) -> folium.M
     # Add layer control to switch between map styles
     folium.LayerControl().add_to(m)
     
+    field_columns = [col for col, _ in POPUP_FIELDS if col in df.columns]
+    field_labels = [label for col, label in POPUP_FIELDS if col in df.columns]
+    selected = set(selected_schools or [])
+    
+    if cluster:
+        # Ship unselected schools as a compact array and let the browser
+        # build and cluster their markers; selected schools get regular
+        # markers below
+        is_selected = df['school_code'].isin(selected).to_numpy()
+        rows = df.loc[~is_selected, ['latitude', 'longitude', 'school_code', *field_columns]]
+        data = rows.astype(object).where(rows.notna(), None).to_numpy().tolist()
+        FastMarkerCluster(
+            data,
+            callback=CLUSTER_MARKER_CALLBACK.replace('__FIELD_LABELS__', json.dumps(field_labels)),
+            name='Schools'
+        ).add_to(m)
+        df = df[is_selected]
+    
+    # Pull the needed columns out as arrays once instead of boxing every row
+    columns = [df[col].to_numpy() for col in ['school_code', 'latitude', 'longitude', *field_columns]]
+    
+    # Markers share one icon per color instead of building one each
+    default_icon = folium.Icon(color='blue', icon='graduation-cap', prefix='fa')
+    selected_icon = folium.Icon(color='red', icon='graduation-cap', prefix='fa')
+    
     # Add markers for each school
-    for idx, row in df.iterrows():
-        # Create popup content
-        popup_content = f"""
-        <b>School Code:</b> {row['school_code']}<br>
-        <b>Coordinates:</b> {row['latitude']:.6f}, {row['longitude']:.6f}
-        """
-        
-        # Add metadata if available
-        if 'NOMBRE CT' in row and pd.notna(row['NOMBRE CT']):
-            popup_content += f"<br><b>Name:</b> {row['NOMBRE CT']}"
-        if 'LOCALIDAD CT' in row and pd.notna(row['LOCALIDAD CT']):
-            popup_content += f"<br><b>Location:</b> {row['LOCALIDAD CT']}"
-        if 'MUNICIPIO CT' in row and pd.notna(row['MUNICIPIO CT']):
-            popup_content += f"<br><b>Municipality:</b> {row['MUNICIPIO CT']}"
-        if 'CORDE' in row and pd.notna(row['CORDE']):
-            popup_content += f"<br><b>Region:</b> {row['CORDE']}"
-        if 'NIVEL' in row and pd.notna(row['NIVEL']):
-            popup_content += f"<br><b>Level:</b> {row['NIVEL']}"
-        if 'FUNCIÓN Y CATALOGO' in row and pd.notna(row['FUNCIÓN Y CATALOGO']):
-            popup_content += f"<br><b>Function:</b> {row['FUNCIÓN Y CATALOGO']}"
-        if 'TIPO ASPIRANTE' in row and pd.notna(row['TIPO ASPIRANTE']):
-            popup_content += f"<br><b>Position Type:</b> {row['TIPO ASPIRANTE']}"
-        
-        # Add Google Maps button
-        google_maps_url = f"https://www.google.com/maps/place/{row['latitude']},{row['longitude']}"
-        popup_content += f"""<br><br>
-        <a href="{google_maps_url}" target="_blank" style="
-            background-color: #4285f4; 
-            color: white; 
-            padding: 8px 12px; 
-            text-decoration: none; 
-            border-radius: 4px; 
-            font-size: 12px;
-            display: inline-block;
-        ">📍 Open in Google Maps</a>
-        """
-        
-        # Determine marker color
-        color = 'red' if selected_schools and row['school_code'] in selected_schools else 'blue'
+    for school_code, latitude, longitude, *field_values in zip(*columns):
+        # Create popup content: header, metadata if available, Google Maps button
+        popup_parts = [POPUP_HEAD_TEMPLATE.format(code=school_code, lat=latitude, lon=longitude)]
+        popup_parts.extend(
+            POPUP_FIELD_TEMPLATE.format(label=label, value=value)
+            for label, value in zip(field_labels, field_values)
+            if pd.notna(value)
+        )
+        popup_parts.append(POPUP_MAPS_BUTTON_TEMPLATE.format(lat=latitude, lon=longitude))
+        popup_content = ''.join(popup_parts)
         
         folium.Marker(
-            location=[row['latitude'], row['longitude']],
+            location=[latitude, longitude],
             popup=folium.Popup(popup_content, max_width=300),
-            tooltip=f"School: {row['school_code']}",
-            icon=folium.Icon(color=color, icon='graduation-cap', prefix='fa')
+            tooltip=f"School: {school_code}",
+            icon=selected_icon if school_code in selected else default_icon
         ).add_to(m)
     
     return m
@@ -218,46 +393,35 @@ def main():
     # School code search
     search_code = st.sidebar.text_input("Search by School Code:", placeholder="e.g. 21DPR0653I")
     
+    # Dropdown options are computed once per data load
+    filter_index = load_filter_index()
+    
     # Region filter
-    regions = ['All'] + sorted(df['CORDE'].dropna().unique().tolist()) if 'CORDE' in df.columns else ['All']
+    regions = ['All'] + filter_index['CORDE'][0] if 'CORDE' in filter_index else ['All']
     selected_region = st.sidebar.selectbox("Select Region:", regions)
     
     # Level filter
-    levels = ['All'] + sorted(df['NIVEL'].dropna().unique().tolist()) if 'NIVEL' in df.columns else ['All']
+    levels = ['All'] + filter_index['NIVEL'][0] if 'NIVEL' in filter_index else ['All']
     selected_level = st.sidebar.selectbox("Select Education Level:", levels)
     
     # Function and catalog filter
-    functions = ['All'] + sorted(df['FUNCIÓN Y CATALOGO'].dropna().unique().tolist()) if 'FUNCIÓN Y CATALOGO' in df.columns else ['All']
+    functions = ['All'] + filter_index['FUNCIÓN Y CATALOGO'][0] if 'FUNCIÓN Y CATALOGO' in filter_index else ['All']
     selected_function = st.sidebar.selectbox("Select Function/Catalog:", functions)
     
     # Tipo aspirante filter
-    tipos = ['All'] + sorted(df['TIPO ASPIRANTE'].dropna().unique().tolist()) if 'TIPO ASPIRANTE' in df.columns else ['All']
+    tipos = ['All'] + filter_index['TIPO ASPIRANTE'][0] if 'TIPO ASPIRANTE' in filter_index else ['All']
     selected_tipo = st.sidebar.selectbox("Select Position Type:", tipos)
     
     # Municipality filter
-    municipios = ['All'] + sorted(df['MUNICIPIO CT'].dropna().unique().tolist()) if 'MUNICIPIO CT' in df.columns else ['All']
+    municipios = ['All'] + filter_index['MUNICIPIO CT'][0] if 'MUNICIPIO CT' in filter_index else ['All']
     selected_municipio = st.sidebar.selectbox("Select Municipality:", municipios)
     
-    # Apply filters
-    filtered_df = df.copy()
-    
-    if search_code:
-        filtered_df = filtered_df[filtered_df['school_code'].str.contains(search_code, case=False, na=False)]
-    
-    if selected_region != 'All' and 'CORDE' in df.columns:
-        filtered_df = filtered_df[filtered_df['CORDE'] == selected_region]
-    
-    if selected_level != 'All' and 'NIVEL' in df.columns:
-        filtered_df = filtered_df[filtered_df['NIVEL'] == selected_level]
-    
-    if selected_function != 'All' and 'FUNCIÓN Y CATALOGO' in df.columns:
-        filtered_df = filtered_df[filtered_df['FUNCIÓN Y CATALOGO'] == selected_function]
-    
-    if selected_tipo != 'All' and 'TIPO ASPIRANTE' in df.columns:
-        filtered_df = filtered_df[filtered_df['TIPO ASPIRANTE'] == selected_tipo]
+    # Marker clustering keeps the map responsive with many schools
+    cluster_markers = st.sidebar.checkbox("Cluster markers", value=True)
     
-    if selected_municipio != 'All' and 'MUNICIPIO CT' in df.columns:
-        filtered_df = filtered_df[filtered_df['MUNICIPIO CT'] == selected_municipio]
+    # Apply filters; the filter state also keys the cached map
+    filters = (search_code, selected_region, selected_level, selected_function, selected_tipo, selected_municipio)
+    filtered_df = filter_school_data(*filters)
     
     # Statistics
     col1, col2, col3, col4 = st.columns(4)
@@ -281,7 +445,7 @@ def main():
         st.subheader("📍 School Locations")
         
         # Create map
-        school_map = create_map(filtered_df)
+        school_map = get_school_map(*filters, cluster=cluster_markers)
         
         # Display map with improved settings
         map_data = st_folium(
@@ -319,7 +483,7 @@ def main():
             )
             
             # Download filtered data
-            csv = filtered_df.to_csv(index=False)
+            csv = get_filtered_csv(*filters)
             st.download_button(
                 label="📥 Download Filtered Data as CSV",
                 data=csv,